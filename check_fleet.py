@@ -0,0 +1,74 @@
+###
+### check_fleet.py: flies a Delta II as a single Rocket and as a RocketFleet with the same flight events, and checks that every
+### rocket in the fleet ends up where the Rocket does. The flight covers SRB separation, both stage separations, throttling
+### down and re-igniting the second stage, and a non-zero roll rate. Run it with `python check_fleet.py` after changing
+### rocket.py or fleet.py. The float64 fleet has to agree to round off, the float32 default only to a loose tolerance.
+###
+from rocket import Rocket, Stage, Payload
+from fleet import RocketFleet
+import numpy as np
+
+G = 9.8 # m/s^2
+TIME_STEP = 0.01 # s
+N_STEPS = 80000 # an 800 s flight
+
+# flight events, keyed by step number
+EVENTS = {0: "ignition", 6330: "srb separation", 26000: "meco", 27000: "stage separation",
+          27600: "second stage ignition", 69400: "seco"}
+
+def build_delta_ii():
+    delta_ii = Rocket(pos=np.zeros(3), coeff_drag=0.82, cross_sec_area=np.pi*1.5**2)
+    delta_ii.add_stage(Stage({"dry_mass": 5.680E3, "fuel_mass": 9.6120E4, "max_thrust_mag": 8.89659E5, "max_dmdt": 368.98, "length": 26.1}))
+    delta_ii.add_stage(Stage({"dry_mass": 950.0, "fuel_mass": 6000.0, "max_thrust_mag": 4.3640E4, "max_dmdt": 13.9, "length": 6.0}))
+    for i in range(4):
+        delta_ii.add_srb(Stage({"dry_mass": 1310.0, "fuel_mass": 11770.0, "max_thrust_mag": 4.46006E5, "max_dmdt": 185.9, "length": 13.1}))
+    delta_ii.add_payload(Payload(mass=3680.0, length=8.49))
+    return delta_ii
+
+def fly(vehicle, total_mass):
+    ### runs the flight on a Rocket or a RocketFleet. total_mass returns the vehicle's mass, a float or an (n,) array. ###
+    for k in range(N_STEPS):
+        event = EVENTS.get(k)
+        if event == "ignition":
+            vehicle.adjust_throttle(100.0)
+            vehicle.ignite_srbs()
+            vehicle.set_roll_rate(0.001)
+        elif event == "srb separation":
+            vehicle.separate_srbs()
+        elif event == "meco":
+            vehicle.adjust_throttle(0.0)
+        elif event == "stage separation":
+            vehicle.separate_active_stage()
+        elif event == "second stage ignition":
+            vehicle.adjust_throttle(100.0)
+        elif event == "seco":
+            vehicle.adjust_throttle(0.0)
+            vehicle.separate_active_stage()
+
+        # thrust and gravity only. Drag is left out, since none of the RocketFleet code is involved in it
+        mass = np.asarray(total_mass(vehicle))
+        force = vehicle.compute_total_thrust() if isinstance(vehicle, Rocket) else vehicle.total_thrust()
+        force[..., 1] -= mass*G
+        vehicle.momentum += force*TIME_STEP
+        vehicle.pos += vehicle.momentum/mass[..., None]*TIME_STEP
+        vehicle.step(TIME_STEP)
+
+def check(dtype, rtol):
+    single = build_delta_ii()
+    fleet = RocketFleet.from_rocket(build_delta_ii(), 4, dtype=dtype)
+    fly(single, lambda r: r.total_mass)
+    fly(fleet, lambda f: f.total_mass())
+
+    for name, expected, actual in (("position", single.pos, fleet.pos),
+                                   ("momentum", single.momentum, fleet.momentum),
+                                   ("total mass", single.total_mass, fleet.total_mass()),
+                                   ("attitude", single.attitude, fleet.attitude)):
+        # compare against the largest component so that a component that is near zero isn't held to a relative tolerance
+        error = np.max(np.abs(actual - expected))/np.max(np.abs(expected))
+        print("{:s} {:s}: max relative difference {:0.2e}".format(np.dtype(dtype).name, name, error))
+        if not error <= rtol:
+            raise AssertionError("RocketFleet {:s} differs from Rocket by {:0.2e}, more than {:0.0e}".format(name, error, rtol))
+
+if __name__ == "__main__":
+    check(np.float64, 1e-9)
+    check(np.float32, 5e-3)
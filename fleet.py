@@ -0,0 +1,204 @@
+from rocket import Rocket, Stage, Payload, _check_coeff_drag, _check_cross_sec_area, _check_time_step, _check_throttle
+import rocket
+import numpy as np
+
+class RocketFleet:
+    ###
+    ### RocketFleet: a batch of n rockets that are simulated together, e.g. for Monte Carlo runs or parameter sweeps. Every
+    ### rocket property is an array with one row per rocket, so a single numpy call updates the whole fleet.
+    ###   pos, momentum, axis - (n,3) arrays
+    ###   theta, coeff_drag, cross_sec_area, roll_rate, payload_mass - (n,) arrays. theta is the angle from vertical and
+    ###             is the attitude state, axis is derived from it.
+    ###   stage_* - (n, max_stages) arrays, column j is stage j of every rocket. active_stage holds the index of each
+    ###             rocket's active stage. Separated stages stay in the table with their masses and throttle zeroed.
+    ###   srb_* - (n, max_srbs) arrays laid out the same way.
+    ### Stages, SRBs and payloads added through add_stage/add_srb/add_payload are given to every rocket. Individual rockets
+    ### can then be varied by writing to the arrays directly.
+    ### All of the float arrays use dtype, float32 by default. For an ensemble the spread of the trajectories from the input
+    ### uncertainty is far larger than float32 round off, and float32 halves the memory the per step update has to move.
+    ### Pass dtype=np.float64 for runs that have to be compared against a single Rocket.
+    ###
+    def __init__(self, n, coeff_drag, cross_sec_area, dtype=np.float32):
+        if rocket._VALIDATE:
+            if not isinstance(n, int):
+                raise TypeError
+            if n <= 0:
+                raise ValueError
+            _check_coeff_drag(coeff_drag)
+            _check_cross_sec_area(cross_sec_area)
+
+        self.n = n
+        self.dtype = np.dtype(dtype)
+        self.pos = np.zeros((n, 3), dtype=dtype)
+        self.momentum = np.zeros((n, 3), dtype=dtype)
+        self.axis = np.zeros((n, 3), dtype=dtype)
+        self.axis[:, 1] = 1.0
+        self.theta = np.zeros(n, dtype=dtype)
+        self.coeff_drag = np.full(n, coeff_drag, dtype=dtype)
+        self.cross_sec_area = np.full(n, cross_sec_area, dtype=dtype)
+        self.roll_rate = np.zeros(n, dtype=dtype)
+        self.payload_mass = np.zeros(n, dtype=dtype)
+
+        self.active_stage = np.zeros(n, dtype=np.intp)
+        self.stage_dry_mass = np.zeros((n, 0), dtype=dtype)
+        self.stage_fuel_mass = np.zeros((n, 0), dtype=dtype)
+        self.stage_max_thrust_mag = np.zeros((n, 0), dtype=dtype)
+        self.stage_max_dmdt = np.zeros((n, 0), dtype=dtype)
+        self.stage_throttle_frac = np.zeros((n, 0), dtype=dtype)
+
+        self.srb_dry_mass = np.zeros((n, 0), dtype=dtype)
+        self.srb_fuel_mass = np.zeros((n, 0), dtype=dtype)
+        self.srb_max_thrust_mag = np.zeros((n, 0), dtype=dtype)
+        self.srb_max_dmdt = np.zeros((n, 0), dtype=dtype)
+        self.srb_throttle_frac = np.zeros((n, 0), dtype=dtype)
+
+        self._rows = np.arange(n)
+
+    @classmethod
+    def from_rocket(cls, template, n, dtype=np.float32):
+        ### builds a fleet of n copies of a Rocket, including its current position, momentum, attitude and fuel state. ###
+        if rocket._VALIDATE and not isinstance(template, Rocket):
+            raise TypeError
+
+        fleet = cls(n, template.coeff_drag, template.cross_sec_area, dtype)
+        fleet.pos[:] = template.pos
+        fleet.momentum[:] = template.momentum
+        fleet.axis[:] = template.axis
+        fleet.theta[:] = template.attitude
+        fleet.roll_rate[:] = template.roll_rate
+        fleet.payload_mass[:] = template.payload_mass
+
+        stages = template.stages
+        fleet.stage_dry_mass = np.tile(stages.dry_mass.astype(dtype), (n, 1))
+        fleet.stage_fuel_mass = np.tile(stages.fuel_mass.astype(dtype), (n, 1))
+        fleet.stage_max_thrust_mag = np.tile(stages.max_thrust_mag.astype(dtype), (n, 1))
+        fleet.stage_max_dmdt = np.tile(stages.max_dmdt.astype(dtype), (n, 1))
+        fleet.stage_throttle_frac = np.tile(stages.throttle_frac.astype(dtype), (n, 1))
+
+        srbs = template.srbs
+        fleet.srb_dry_mass = np.tile(srbs.dry_mass.astype(dtype), (n, 1))
+        fleet.srb_fuel_mass = np.tile(srbs.fuel_mass.astype(dtype), (n, 1))
+        fleet.srb_max_thrust_mag = np.tile(srbs.max_thrust_mag.astype(dtype), (n, 1))
+        fleet.srb_max_dmdt = np.tile(srbs.max_dmdt.astype(dtype), (n, 1))
+        fleet.srb_throttle_frac = np.tile(srbs.throttle_frac.astype(dtype), (n, 1))
+
+        return fleet
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return "Rocket fleet of {:d} rockets with {:d} stages and {:d} SRBs each. Mean total mass: {:0.2f} kg".format(
+            self.n, self.stage_dry_mass.shape[1], self.srb_dry_mass.shape[1], self.total_mass().mean())
+
+    def add_stage(self, stage):
+        if rocket._VALIDATE and not isinstance(stage, Stage):
+            raise TypeError
+        self.stage_dry_mass = _append_column(self.stage_dry_mass, stage.dry_mass)
+        self.stage_fuel_mass = _append_column(self.stage_fuel_mass, stage.fuel_mass)
+        self.stage_max_thrust_mag = _append_column(self.stage_max_thrust_mag, stage.max_thrust_mag)
+        self.stage_max_dmdt = _append_column(self.stage_max_dmdt, stage.max_dmdt)
+        self.stage_throttle_frac = _append_column(self.stage_throttle_frac, stage.throttle_frac)
+
+    def add_srb(self, srb):
+        if rocket._VALIDATE and not isinstance(srb, Stage):
+            raise TypeError
+        self.srb_dry_mass = _append_column(self.srb_dry_mass, srb.dry_mass)
+        self.srb_fuel_mass = _append_column(self.srb_fuel_mass, srb.fuel_mass)
+        self.srb_max_thrust_mag = _append_column(self.srb_max_thrust_mag, srb.max_thrust_mag)
+        self.srb_max_dmdt = _append_column(self.srb_max_dmdt, srb.max_dmdt)
+        self.srb_throttle_frac = _append_column(self.srb_throttle_frac, srb.throttle_frac)
+
+    def add_payload(self, payload):
+        if rocket._VALIDATE and not isinstance(payload, Payload):
+            raise TypeError
+        self.payload_mass += payload.mass
+
+    def total_mass(self):
+        ### returns an (n,) array with the total mass of each rocket ###
+        return (self.stage_dry_mass.sum(axis=1) + self.stage_fuel_mass.sum(axis=1)
+                + self.srb_dry_mass.sum(axis=1) + self.srb_fuel_mass.sum(axis=1)
+                + self.payload_mass)
+
+    def total_thrust(self, out=None):
+        ### returns an (n,3) array with the thrust vector of each rocket. If out is given the result is written into it. ###
+        thrust_mag = (self.srb_max_thrust_mag*self.srb_throttle_frac).sum(axis=1)
+        if self.stage_dry_mass.shape[1] > 0:
+            idx = self._active_stage_column()
+            thrust_mag += self.stage_max_thrust_mag[self._rows, idx]*self.stage_throttle_frac[self._rows, idx]
+        return np.multiply(thrust_mag[:, None], self.axis, out=out)
+
+    @property
+    def attitude(self):
+        return self.theta
+
+    def step(self, time_step):
+        ### advances the mass and attitude of every rocket by one time step, the same update as Rocket.step. ###
+        if rocket._VALIDATE:
+            _check_time_step(time_step)
+        # cast once so that none of the products below are promoted to float64
+        time_step = self.dtype.type(time_step)
+
+        # burn fuel in each rocket's active stage and in the SRBs
+        if self.stage_dry_mass.shape[1] > 0:
+            idx = self._active_stage_column()
+            rows = self._rows
+            self.stage_fuel_mass[rows, idx] -= self.stage_max_dmdt[rows, idx]*self.stage_throttle_frac[rows, idx]*time_step
+        self.srb_fuel_mass -= self.srb_max_dmdt*self.srb_throttle_frac*time_step
+
+        # rotate every axis away from vertical by roll_rate*time_step
+        self.theta += self.roll_rate*time_step
+        self.axis[:, 0] = np.sin(self.theta)
+        self.axis[:, 1] = np.cos(self.theta)
+        self.axis[:, 2] = 0.0
+
+    def set_roll_rate(self, roll_rate):
+        if rocket._VALIDATE and not isinstance(roll_rate, float):
+            raise TypeError
+        self.roll_rate[:] = roll_rate
+
+    def adjust_throttle(self, throttle):
+        ### sets the throttle of the active stage of every rocket that still has one ###
+        if rocket._VALIDATE:
+            _check_throttle(throttle)
+        if self.stage_dry_mass.shape[1] > 0:
+            live = self._rows[self.active_stage < self.stage_dry_mass.shape[1]]
+            self.stage_throttle_frac[live, self.active_stage[live]] = throttle*0.01
+
+    def ignite_srbs(self):
+        self.srb_throttle_frac[:] = 1.0
+
+    def separate_active_stage(self, mask=None):
+        ### drops the active stage of the rockets selected by the boolean (n,) mask, or of every rocket if mask is None. ###
+        # the momentum is rescaled so that the velocity of each rocket doesn't suddenly spike
+        rows = self._rows if mask is None else self._rows[mask]
+        rows = rows[self.active_stage[rows] < self.stage_dry_mass.shape[1]]
+        idx = self.active_stage[rows]
+        old_mass = self.total_mass()[rows]
+        new_mass = old_mass - (self.stage_dry_mass[rows, idx] + self.stage_fuel_mass[rows, idx])
+        self.stage_dry_mass[rows, idx] = 0.0
+        self.stage_fuel_mass[rows, idx] = 0.0
+        self.stage_throttle_frac[rows, idx] = 0.0
+        self.active_stage[rows] += 1
+        self.momentum[rows] *= _mass_ratio(new_mass, old_mass)[:, None]
+
+    def separate_srbs(self, mask=None):
+        ### jettisons all of the SRBs of the rockets selected by the boolean (n,) mask, or of every rocket if mask is None. ###
+        rows = self._rows if mask is None else self._rows[mask]
+        old_mass = self.total_mass()[rows]
+        new_mass = old_mass - (self.srb_dry_mass[rows].sum(axis=1) + self.srb_fuel_mass[rows].sum(axis=1))
+        self.srb_dry_mass[rows] = 0.0
+        self.srb_fuel_mass[rows] = 0.0
+        self.srb_throttle_frac[rows] = 0.0
+        self.momentum[rows] *= _mass_ratio(new_mass, old_mass)[:, None]
+
+    def _active_stage_column(self):
+        # rockets that have separated all of their stages point at their last (zeroed) stage, so they neither burn nor push
+        return np.minimum(self.active_stage, self.stage_dry_mass.shape[1] - 1)
+
+def _mass_ratio(new_mass, old_mass):
+    # new_mass/old_mass, with rows that had no mass left as 1 so their momentum is untouched rather than turned into NaN
+    return np.divide(new_mass, old_mass, out=np.ones_like(old_mass), where=old_mass > 0)
+
+def _append_column(table, value):
+    return np.concatenate((table, np.full((table.shape[0], 1), value, dtype=table.dtype)), axis=1)
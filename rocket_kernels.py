@@ -0,0 +1,41 @@
+import math
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional. Without it the kernels below run as ordinary python functions.
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+# the kernels are compiled for these signatures when the module is imported, so the first timestep doesn't pay for compilation
+_JIT_OPTIONS = {"cache": True, "fastmath": True, "error_model": "numpy"}
+
+@njit(["float64(float64[:], float64[:], float64)"], **_JIT_OPTIONS)
+def _total_mass(dry, fuel, payload_sum):
+    """Returns the sum of the dry and fuel masses of a stage table plus the payload mass."""
+    total = payload_sum
+    for i in range(dry.shape[0]):
+        total += dry[i] + fuel[i]
+    return total
+
+@njit(["float64(float64[:], float64[:], float64[:], float64)"], **_JIT_OPTIONS)
+def _update_fuel(fuel, dmdt, thr_frac, dt):
+    """Burns fuel in place for one time step and returns the total mass of fuel burned."""
+    burned = 0.0
+    for i in range(fuel.shape[0]):
+        dm = dmdt[i]*thr_frac[i]*dt
+        fuel[i] -= dm
+        burned += dm
+    return burned
+
+@njit(["float64(float64[:], float64, float64, float64)"], **_JIT_OPTIONS)
+def _update_axis(axis, theta, roll_rate, dt):
+    """Advances the angle from vertical theta by roll_rate*dt, writes the matching unit axis in the xy-plane in place and returns the new angle."""
+    # math rather than numpy: the same machine code under numba, and no numpy scalar dispatch when numba isn't installed
+    theta += roll_rate*dt
+    axis[0] = math.sin(theta)
+    axis[1] = math.cos(theta)
+    axis[2] = 0.0
+    return theta